@@ -1,24 +1,28 @@
 #!/usr/bin/env python3
 import os
 import sys
+import signal
+import asyncio
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
-import json
+import orjson
 from typing import List, Dict, Any
 
 
 
-def load_approvable_states() -> set[str]:
+def load_approvable_states() -> frozenset[str]:
     raw = os.getenv("CL_APPROVABLE_STATES")
     if not raw:
         print("[WARN] CL_APPROVABLE_STATES not set. Using default states.")
-        return {
+        return frozenset({
             "PENDING",
             "REQUIRES_ADMIN_APPROVAL",
             "VERSION_PENDING",
             "PROPOSED",
-        }
-    states = {s.strip().upper() for s in raw.split(",") if s.strip()}
+        })
+    states = frozenset(s.strip().upper() for s in raw.split(",") if s.strip())
     print(f"[INFO] Loaded APPROVABLE_STATES from env: {states}")
     return states
 
@@ -28,22 +32,102 @@ NODE_URL = os.getenv("CL_NODE_URL")
 CL_EMAIL = os.getenv("CL_EMAIL")
 CL_PASSWORD = os.getenv("CL_PASSWORD")
 FEEDS_MANAGER_ID = os.getenv("CL_FEEDS_MANAGER_ID", "1")
-INTERVAL = os.getenv("CL_INTERVAL", "300")
+INTERVAL = int(os.getenv("CL_INTERVAL", "300"))
 NETWORK = os.getenv("CL_NETWORK")
 GRAPHQL_ENDPOINT = NODE_URL.rstrip("/") + "/query"
 SESSIONS_ENDPOINT = NODE_URL.rstrip("/") + "/sessions"
 SLACK_WEBHOOK_URL = os.getenv("CL_SLACK_WEBHOOK")
+CA_BUNDLE = os.getenv("CL_CA_BUNDLE")
+FETCH_TTL = int(os.getenv("CL_FETCH_TTL", "0"))
 APPROVABLE_STATES = load_approvable_states()
 
+_FETCH_PROPOSALS_QUERY = """
+query FetchFeedManagerWithProposals($id: ID!) {
+  feedsManager(id: $id) {
+    __typename
+    ... on FeedsManager {
+      id
+      name
+      jobProposals {
+        id
+        name
+        externalJobID
+        status
+      }
+    }
+    ... on NotFoundError {
+      message
+      code
+    }
+  }
+}
+"""
+
+# One aliased selection per spec in approve_many(), formatted with the alias index.
+_APPROVE_SPEC_SELECTION = (
+    "a{i}: approveJobProposalSpec(id: $id{i}, force: $f{i}) {{ __typename "
+    "... on ApproveJobProposalSpecSuccess {{ spec {{ id }} }} "
+    "... on NotFoundError {{ message }} }}"
+)
+
 
 
 session = requests.Session()
+session.verify = CA_BUNDLE or True
+session.trust_env = False
+session.headers["Content-Type"] = "application/json"
+session.headers["Accept-Encoding"] = "gzip, deflate"
+# POST is deliberately left out of allowed_methods: urllib3 then retries POSTs
+# only on connect errors, where nothing reached the node. A read timeout or 5xx
+# may come after the node already approved specs or created a session, and
+# resending the approval mutation is not idempotent.
+adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=32,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET", "DELETE"]),
+        raise_on_status=False,
+    ),
+)
+session.mount("https://", adapter)
+session.mount("http://", adapter)
+
+# Slack lines collected during a cycle, sent as one message by flush_log().
+_log_buffer: list[str] = []
+
+# Last successful fetch_job_proposals() result, reused for FETCH_TTL seconds.
+_last_fetch = {"data": None, "ts": 0.0}
+
+slack_session = requests.Session()
+slack_session.headers.update({"Content-Type": "application/json"})
+slack_session.mount("https://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=4,
+    max_retries=Retry(
+        total=2,
+        backoff_factor=0.3,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(["POST"]),
+        raise_on_status=False,
+    ),
+))
+
+
+
+class NodeError(RuntimeError):
+    """
+    Raised when a request to the Chainlink node fails. Caught per cycle by
+    _driver(), so the process and its pooled session survive to retry.
+    """
 
 
 
-def die(msg: str, code: int = 1):
-    print(f"[FATAL] {msg}", file=sys.stderr)
-    sys.exit(code)
+def die(msg: str):
+    print(f"[ERROR] {msg}", file=sys.stderr)
+    raise NodeError(msg)
 
 
 
@@ -59,10 +143,9 @@ def log(msg: str):
     payload = {"text": msg}
 
     try:
-        resp = requests.post(
+        resp = slack_session.post(
             SLACK_WEBHOOK_URL,
-            data=json.dumps(payload),
-            headers={"Content-Type": "application/json"},
+            data=orjson.dumps(payload),
             timeout=10,
         )
     except Exception as e:
@@ -74,13 +157,34 @@ def log(msg: str):
 
 
 
+def log_buffered(msg: str):
+    """
+    Queue a Slack line to be sent with the rest of the cycle by flush_log().
+    """
+    _log_buffer.append(msg)
+
+
+
+def flush_log():
+    """
+    Send all buffered Slack lines as a single message.
+    """
+    if not _log_buffer:
+        return
+
+    msg = "\n".join(_log_buffer)
+    _log_buffer.clear()
+    log(msg)
+
+
+
 def login():
     if not CL_EMAIL or not CL_PASSWORD:
         die("CL_EMAIL and CL_PASSWORD environment variables are required")
     print(f"[INFO] Logging into Chainlink node at {SESSIONS_ENDPOINT} ...")
 
     try:
-        resp = session.post(SESSIONS_ENDPOINT, json={"email": CL_EMAIL, "password": CL_PASSWORD}, timeout=10, verify=False)
+        resp = session.post(SESSIONS_ENDPOINT, json={"email": CL_EMAIL, "password": CL_PASSWORD}, timeout=10)
     except requests.RequestException as e:
         die(f"Error connecting to node while logging in: {e}")
 
@@ -93,7 +197,7 @@ def login():
 def logout():
     print("[INFO] Logging out of Chainlink node...")
     try:
-        resp = session.delete(SESSIONS_ENDPOINT, timeout=10, verify=False)
+        resp = session.delete(SESSIONS_ENDPOINT, timeout=10)
     except Exception as e:
         print(f"[WARN] Logout request failed in a very on-brand Chainlink way: {e}")
         return
@@ -105,30 +209,71 @@ def logout():
 
 
 
-def gql(query: str, variables: Dict[str, Any] = None) -> Dict[str, Any]:
+def _is_unauthorized(body: Dict[str, Any]) -> bool:
+    """
+    True if the node rejected the session and nothing in the document ran.
+    Any non-null field in data means (part of) a mutation may have gone
+    through, so such a response must never be retried.
+    """
+    if any(v is not None for v in (body.get("data") or {}).values()):
+        return False
+    return any(
+        (err.get("extensions") or {}).get("code") == "UNAUTHORIZED"
+        for err in body.get("errors") or []
+    )
+
+
+
+def _gql_request(query: str, variables: Dict[str, Any] = None, _retry: bool = True) -> Dict[str, Any]:
+    """
+    Send a GraphQL request to the node and return the decoded response body,
+    "errors" included. If the session cookie has expired, log in again and
+    retry the request exactly once.
+    """
     payload = {"query": query}
     if variables is not None:
         payload["variables"] = variables
 
     try:
-        resp = session.post(GRAPHQL_ENDPOINT, json=payload, timeout=15)
+        resp = session.post(GRAPHQL_ENDPOINT, data=orjson.dumps(payload), timeout=15)
     except requests.RequestException as e:
         die(f"GraphQL request failed: {e}")
 
+    if resp.status_code == 401 and _retry:
+        print("[WARN] Node session rejected (HTTP 401), logging in again ...")
+        login()
+        return _gql_request(query, variables, _retry=False)
+
     if resp.status_code != 200:
         die(f"GraphQL HTTP error {resp.status_code}: {resp.text}")
 
-    data = resp.json()
-    if "errors" in data:
-        die(f"GraphQL errors: {data['errors']}")
+    try:
+        body = orjson.loads(resp.content)
+    except orjson.JSONDecodeError as e:
+        die(f"GraphQL JSON decode error: {e}; body={resp.text[:500]}")
+
+    if "errors" in body and _retry and _is_unauthorized(body):
+        print("[WARN] Node session rejected (GraphQL unauthorized), logging in again ...")
+        login()
+        return _gql_request(query, variables, _retry=False)
 
-    return data.get("data", {})
+    return body
+
+
+
+def gql(query: str, variables: Dict[str, Any] = None) -> Dict[str, Any]:
+    body = _gql_request(query, variables)
+    if "errors" in body:
+        die(f"GraphQL errors: {body['errors']}")
+
+    return body.get("data", {})
 
 
 
 def fetch_job_proposals() -> list[dict]:
     """
-    Fetch job proposals via the same GraphQL query the Operator UI uses:
+    Fetch job proposals via the GraphQL query the Operator UI uses, trimmed
+    down to the fields we actually read:
     FetchFeedManagerWithProposals(id: ID!)
 
     Returns a flat list of JobProposal objects:
@@ -137,53 +282,26 @@ def fetch_job_proposals() -> list[dict]:
         "id": "...",
         "name": "...",
         "externalJobID": "...",
-        "remoteUUID": "...",
         "status": "PENDING" | "APPROVED" | ...,
-        "pendingUpdate": bool,
-        "latestSpec": {
-          "createdAt": "...",
-          "version": int,
-        },
-        "__typename": "JobProposal",
       },
       ...
     ]
-    """
 
-    query = """
-    query FetchFeedManagerWithProposals($id: ID!) {
-      feedsManager(id: $id) {
-        __typename
-        ... on FeedsManager {
-          id
-          name
-          jobProposals {
-            id
-            name
-            externalJobID
-            remoteUUID
-            status
-            pendingUpdate
-            latestSpec {
-              createdAt
-              version
-              __typename
-            }
-            __typename
-          }
-        }
-        ... on NotFoundError {
-          message
-          code
-        }
-      }
-    }
+    If CL_FETCH_TTL is set, the previous result is returned as-is while it is
+    younger than that many seconds. run_once() drops the cached result
+    whenever it approves something, so it only ever short-circuits polls
+    that found nothing to do.
     """
 
+    cached = _last_fetch["data"]
+    if cached is not None and time.monotonic() - _last_fetch["ts"] < FETCH_TTL:
+        print(f"[INFO] Reusing {len(cached)} job proposals fetched less than {FETCH_TTL}s ago.")
+        return cached
+
     variables = {"id": str(FEEDS_MANAGER_ID)}
     print(f"[INFO] Fetching job proposals via GraphQL for feedsManager id={FEEDS_MANAGER_ID} ...")
 
-    data = gql(query, variables)  # uses your existing gql() helper
+    data = gql(_FETCH_PROPOSALS_QUERY, variables)  # uses your existing gql() helper
 
     fm = data.get("feedsManager")
     if not fm:
@@ -201,128 +319,196 @@ def fetch_job_proposals() -> list[dict]:
 
     proposals = fm.get("jobProposals") or []
     print(f"[INFO] Retrieved {len(proposals)} job proposals from feedsManager {fm.get('id')!r} ({fm.get('name')!r}).")
+
+    _last_fetch["data"] = proposals
+    _last_fetch["ts"] = time.monotonic()
     return proposals
 
 
 
 def filter_approvable(proposals: list[dict]) -> list[dict]:
-    ready = []
-    for p in proposals:
-        status = (p.get("status") or "").upper()
-        if status in APPROVABLE_STATES:
-            ready.append(p)
+    # status is a GraphQL enum, so the node already sends it uppercase.
+    # Local alias avoids a global name lookup per proposal.
+    states = APPROVABLE_STATES
+    ready = [p for p in proposals if p.get("status") in states]
 
-    print(f"[INFO] Found {len(ready)} proposals in approvable states: {sorted(APPROVABLE_STATES)}")
+    print(f"[INFO] Found {len(ready)} proposals in approvable states: {sorted(states)}")
 
     if len(ready) > 0:
-        log(f"[INFO] Found {len(ready)} proposals in approvable states: {sorted(APPROVABLE_STATES)}")
+        log_buffered(f"[INFO] Found {len(ready)} proposals in approvable states: {sorted(states)}")
 
     return ready
 
 
 
-def approve_job_proposal_spec(spec_id: str, force: bool = True) -> bool:
-    mutation = """
-    mutation ApproveJobProposalSpec($id: ID!, $force: Boolean) {
-      approveJobProposalSpec(id: $id, force: $force) {
-        __typename
-        ... on ApproveJobProposalSpecSuccess {
-          spec {
-            id
-            __typename
-          }
-          __typename
-        }
-        ... on NotFoundError {
-          message
-          __typename
-        }
-      }
-    }
+def approve_many(spec_ids: list[str], force: bool = True) -> int:
     """
+    Approve all given job proposal specs in a single GraphQL request, with one
+    aliased approveJobProposalSpec selection (a0, a1, ...) per spec id.
 
-    variables = {"id": str(spec_id), "force": force}
-    print(f"[INFO] Approving job proposal spec id={spec_id} (force={force}) ...")
-
-    data = gql(mutation, variables)
-    result = data.get("approveJobProposalSpec")
+    Returns the number of specs that were successfully approved.
+    """
+    if not spec_ids:
+        return 0
+
+    params = []
+    selections = []
+    variables = {}
+    for i, spec_id in enumerate(spec_ids):
+        params.append(f"$id{i}: ID!, $f{i}: Boolean")
+        selections.append(_APPROVE_SPEC_SELECTION.format(i=i))
+        variables[f"id{i}"] = str(spec_id)
+        variables[f"f{i}"] = force
+
+    mutation = (
+        f"mutation ApproveJobProposalSpecs({', '.join(params)}) {{\n  "
+        + "\n  ".join(selections)
+        + "\n}"
+    )
+
+    print(f"[INFO] Approving {len(spec_ids)} job proposal specs in one request (force={force}) ...")
+
+    # Not gql(): one spec failing must not throw away the other specs' results.
+    body = _gql_request(mutation, variables)
+    data = body.get("data")
+    if not data:
+        die(f"GraphQL errors: {body.get('errors')}")
+
+    # Errors carry the alias they belong to as the first element of their path.
+    aliases = {f"a{i}" for i in range(len(spec_ids))}
+    alias_errors = {}
+    for err in body.get("errors") or []:
+        path = err.get("path") or []
+        alias = path[0] if path else None
+        if alias in aliases:
+            alias_errors[alias] = err.get("message")
+        else:
+            print(f"[ERROR] GraphQL error during approvals: {err}")
+            log_buffered(f"[ERROR] GraphQL error during approvals: {err.get('message')}")
+
+    successes = 0
+    for i, spec_id in enumerate(spec_ids):
+        alias = f"a{i}"
+        if alias in alias_errors:
+            print(f"[ERROR] approveJobProposalSpec failed for spec id={spec_id}: {alias_errors[alias]}")
+            log_buffered(f"[ERROR] approveJobProposalSpec failed for spec id={spec_id}: {alias_errors[alias]}")
+            continue
+
+        result = data.get(alias)
+
+        if not result:
+            print(f"[ERROR] approveJobProposalSpec returned no data for spec id={spec_id}")
+            log_buffered(f"[ERROR] approveJobProposalSpec returned no data for spec id={spec_id}")
+            continue
+
+        typename = result.get("__typename")
+        if typename == "ApproveJobProposalSpecSuccess":
+            spec = result.get("spec") or {}
+            print(f"[INFO] Successfully approved spec id={spec.get('id')}")
+            log_buffered(f"[INFO] Successfully approved spec id={spec.get('id')}")
+            successes += 1
+            continue
+
+        if typename == "NotFoundError":
+            print(f"[ERROR] Spec not found while approving id={spec_id}: {result.get('message')}")
+            log_buffered(f"[ERROR] Spec not found while approving id={spec_id}: {result.get('message')}")
+            continue
+
+        print(f"[ERROR] Unexpected response type from approveJobProposalSpec: {typename}")
+        log_buffered(f"[ERROR] Unexpected response type from approveJobProposalSpec: {typename}")
+
+    return successes
+
+
+
+def run_once():
+    """
+    One polling cycle: fetch proposals and approve the approvable ones.
+    Assumes login() has already been called. Slack lines logged during the
+    cycle are sent as one message when it ends, even if it fails.
+    """
+    try:
+        proposals = fetch_job_proposals()
+        if not proposals:
+            print("[INFO] No proposals returned. Nothing to do.")
+            return
 
-    if not result:
-        print(f"[ERROR] approveJobProposalSpec returned no data for spec id={spec_id}")
-        log(f"[ERROR] approveJobProposalSpec returned no data for spec id={spec_id}")
-        return False
+        approvable = filter_approvable(proposals)
+        if not approvable:
+            print("[INFO] No proposals in approvable states. Nothing to do.")
+            return
 
-    typename = result.get("__typename")
-    if typename == "ApproveJobProposalSpecSuccess":
-        spec = result.get("spec") or {}
-        print(f"[INFO] Successfully approved spec id={spec.get('id')}")
-        log(f"[INFO] Successfully approved spec id={spec.get('id')}")
-        return True
+        for p in approvable:
+            pid = p.get("id")
+            status = p.get("status")
+            ext = p.get("externalJobID")
+            name = p.get("name")
 
-    if typename == "NotFoundError":
-        print(f"[ERROR] Spec not found while approving id={spec_id}: {result.get('message')}")
-        log(f"[ERROR] Spec not found while approving id={spec_id}: {result.get('message')}")
-        return False
+            print(
+                f"[INFO] Processing proposal id={pid}, status={status}, "
+                f"externalJobID={ext}, name={name}"
+            )
 
-    print(f"[ERROR] Unexpected response type from approveJobProposalSpec: {typename}")
-    log(f"[ERROR] Unexpected response type from approveJobProposalSpec: {typename}")    
-    return False
+        # Proposal states are about to change, so the next cycle must refetch.
+        _last_fetch["data"] = None
+        successes = approve_many([p.get("id") for p in approvable])
+        failures = len(approvable) - successes
 
+        print(f"[INFO] Done. Attempted {len(approvable)} approvals, failures={failures}, successes={successes}.")
 
+        if len(approvable) > 0:
+            log_buffered(f"[INFO] Done. Attempted {len(approvable)} approvals, failures={failures}, successes={successes}.")
+    finally:
+        flush_log()
 
-def main():
-    print("[INFO] Chainlink auto-approver starting up.")
 
-    login()
 
-    proposals = fetch_job_proposals()
-    if not proposals:
-        print("[INFO] No proposals returned. Nothing to do.")
-        logout()
-        return
+async def run_once_async():
+    # run_once() is blocking requests code; run it off the event loop thread.
+    await asyncio.to_thread(run_once)
 
-    approvable = filter_approvable(proposals)
-    if not approvable:
-        print("[INFO] No proposals in approvable states. Nothing to do.")
-        logout()
-        return
 
-    failures = 0
-    for p in approvable:
-        pid = p.get("id")
-        state = p.get("state")
-        ext = p.get("externalJobID")
-        name = p.get("name")
 
-        print(
-            f"[INFO] Processing proposal id={pid}, state={state}, "
-            f"externalJobID={ext}, name={name}"
-        )
+async def _driver():
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
 
+    while not stop.is_set():
         try:
-            approve_job_proposal_spec(pid)
-        except SystemExit:
-            raise
+            await run_once_async()
         except Exception as e:
-            failures += 1
-            print(f"[ERROR] Failed to approve proposal id={pid}: {e}", file=sys.stderr)
-            logout()
+            print(f"[ERROR] run_once() exploded: {e}")
 
-    print(f"[INFO] Done. Attempted {len(approvable)} approvals, failures={failures}, successes={len(approvable) - failures}.")
+        print(f"[INFO] Sleeping {INTERVAL} seconds ...")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=INTERVAL)
+        except asyncio.TimeoutError:
+            pass
 
-    if len(approvable) > 0:
-        log(f"[INFO] Done. Attempted {len(approvable)} approvals, failures={failures}, successes={len(approvable) - failures}.")
+    print("[INFO] Shutdown requested, stopping.")
 
-    logout()
 
 
+def main():
+    print("[INFO] Chainlink auto-approver starting up.")
 
-if __name__ == "__main__":
-    while True:
-        try:
-            main()
-        except Exception as e:
-            print(f"[ERROR] main() exploded: {e}")
+    if 0 < FETCH_TTL <= INTERVAL:
+        print(f"[WARN] CL_FETCH_TTL={FETCH_TTL} is not longer than CL_INTERVAL={INTERVAL}; the proposals cache will never be used.")
 
-        print(f"[INFO] Sleeping {int(INTERVAL)} seconds ...")
-        time.sleep(int(INTERVAL))
+    login()
+
+    try:
+        asyncio.run(_driver())
+    finally:
+        logout()
+
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except NodeError:
+        # Startup login failed; die() already reported why.
+        sys.exit(1)